@@ -1,9 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, insert, bindparam
 from datetime import datetime, timedelta
 from typing import Optional
+from types import SimpleNamespace
+from cachetools import TTLCache
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import bcrypt
+import hashlib
+import jwt
+import os
+import time
 
 from app.core.database import get_db
 from app.core.config import settings
@@ -16,44 +27,163 @@ from app.core.redis_client import redis_client
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token")
 
+# Access-token decode options, built once rather than per request
+_DECODE_KW = {
+    "key": settings.secret_key,
+    "algorithms": [settings.algorithm],
+    "options": {"require": ["exp", "sub", "user_id"]},
+}
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> User:
-    """Get current authenticated user"""
-    credentials_exception = HTTPException(
+# Decoded JWT payloads keyed by token digest; skips signature verification for hot tokens
+_jwt_cache = TTLCache(maxsize=10000, ttl=5)
+
+# Tokens recently confirmed as not blacklisted. Other workers may keep accepting a
+# logged-out token for up to the TTL; logout evicts it from the local worker.
+_bl_negative = TTLCache(maxsize=20000, ttl=30)
+
+# Auth-relevant user fields keyed by user_id; balances are never cached here
+_user_cache = TTLCache(maxsize=5000, ttl=60)
+
+# Prebuilt lookups, so each request only binds parameters into cached SQL
+_USER_BY_USERNAME_STMT = select(User).where(User.username == bindparam("username"))
+_USER_BY_EMAIL_OR_USERNAME_STMT = select(User).where(
+    (User.email == bindparam("email")) | (User.username == bindparam("username"))
+)
+
+# Argon2id with OWASP-recommended parameters (46 MiB, t=3, p=1)
+_ph = PasswordHasher(time_cost=3, memory_cost=46 * 1024, parallelism=1)
+
+# argon2-cffi and bcrypt release the GIL, so hashing scales with these threads
+_pw_executor = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="pwhash")
+
+# Verified against when the username is unknown, so failed logins take the same time
+_DUMMY_HASH = _ph.hash("x" * 32)
+
+
+def _hash_password(password: str) -> str:
+    """Hash a password with Argon2id"""
+    return _ph.hash(password)
+
+
+def _verify_password(password: str, hashed_password: str) -> bool:
+    """Verify a password against an Argon2id hash or a legacy bcrypt hash"""
+    if hashed_password.startswith("$2"):
+        return bcrypt.checkpw(password.encode(), hashed_password.encode())
+    try:
+        return _ph.verify(hashed_password, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+
+def _needs_rehash(hashed_password: str) -> bool:
+    """Whether a stored hash is legacy bcrypt or uses outdated Argon2 parameters"""
+    return hashed_password.startswith("$2") or _ph.check_needs_rehash(hashed_password)
+
+
+async def _offload(func, *args):
+    """Run a CPU-bound password function without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pw_executor, func, *args)
+
+
+def _token_key(token: str) -> bytes:
+    """Short digest of a token used as an in-process cache key"""
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def _decode_token_cached(token: str) -> dict:
+    """Decode an access token, reusing a recently verified payload when possible"""
+    key = _token_key(token)
+    payload = _jwt_cache.get(key)
+    if payload is not None and payload.get("exp", 0) > time.time():
+        return payload
+    
+    payload = jwt.decode(token, **_DECODE_KW)
+    # Hits are re-checked against exp, so an entry never outlives its token
+    _jwt_cache[key] = payload
+    return payload
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
+
+
+async def _authenticate_token(token: str) -> dict:
+    """Validate a bearer token and return its payload"""
     try:
-        payload = AuthService.decode_access_token(token)
+        payload = _decode_token_cached(token)
         username: str = payload.get("sub")
         user_id: int = payload.get("user_id")
         if username is None or user_id is None:
-            raise credentials_exception
+            raise _credentials_exception()
     except Exception:
-        raise credentials_exception
+        raise _credentials_exception()
     
     # Check if token is blacklisted
-    is_blacklisted = await redis_client.get(f"blacklisted_token:{token}")
-    if is_blacklisted:
-        raise credentials_exception
+    token_key = _token_key(token)
+    if token_key not in _bl_negative:
+        is_blacklisted = await redis_client.exists(f"bl:{token_key.hex()}")
+        if is_blacklisted:
+            raise _credentials_exception()
+        # Only cache a confirmed negative; a Redis error (None) is retried next request
+        if is_blacklisted is False:
+            _bl_negative[token_key] = True
     
-    result = await db.execute(select(User).where(User.username == username))
-    user = result.scalar_one_or_none()
-    if user is None:
-        raise credentials_exception
+    return payload
+
+
+def _user_snapshot(user: User) -> SimpleNamespace:
+    """Immutable-by-convention copy of the auth-relevant user fields"""
+    return SimpleNamespace(id=user.id, username=user.username, is_active=user.is_active)
+
+
+def invalidate_cached_user(user_id: int) -> None:
+    """Drop a user's cached snapshot after a mutation"""
+    _user_cache.pop(user_id, None)
+
+
+async def _load_user(payload: dict, db: AsyncSession) -> User:
+    # Primary-key lookup goes through the session identity map before hitting SQL
+    user = await db.get(User, payload["user_id"])
+    if user is None or user.username != payload["sub"]:
+        raise _credentials_exception()
+    _user_cache[user.id] = _user_snapshot(user)
     return user
 
 
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> User:
+    """Get current authenticated user"""
+    payload = await _authenticate_token(token)
+    return await _load_user(payload, db)
+
+
+async def get_current_user_snapshot(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db)
+) -> SimpleNamespace:
+    """Get a cached snapshot of the current user (id, username, is_active).
+    
+    Use this for endpoints that only need the caller's identity; endpoints that
+    read the balance or mutate the user need the ORM instance from get_current_user.
+    """
+    payload = await _authenticate_token(token)
+    snapshot = _user_cache.get(payload["user_id"])
+    if snapshot is None:
+        snapshot = _user_snapshot(await _load_user(payload, db))
+    return snapshot
+
+
 @router.post("/auth/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def register(user_data: RegisterRequest, db: AsyncSession = Depends(get_db)):
     """Register a new user"""
     # Check if user already exists
     result = await db.execute(
-        select(User).where(
-            (User.email == user_data.email) | (User.username == user_data.username)
-        )
+        _USER_BY_EMAIL_OR_USERNAME_STMT,
+        {"email": user_data.email, "username": user_data.username}
     )
     existing_user = result.scalar_one_or_none()
     if existing_user:
@@ -63,18 +193,19 @@ async def register(user_data: RegisterRequest, db: AsyncSession = Depends(get_db
         )
     
     # Create new user
-    hashed_password = AuthService.get_password_hash(user_data.password)
-    new_user = User(
-        email=user_data.email,
-        username=user_data.username,
-        hashed_password=hashed_password,
-        full_name=user_data.full_name,
-        balance=1000.0  # Initial balance for demo
+    hashed_password = await _offload(_hash_password, user_data.password)
+    # RETURNING loads server defaults (id, created_at) without a follow-up SELECT
+    result = await db.execute(
+        insert(User).values(
+            email=user_data.email,
+            username=user_data.username,
+            hashed_password=hashed_password,
+            full_name=user_data.full_name,
+            balance=1000.0  # Initial balance for demo
+        ).returning(User)
     )
-    
-    db.add(new_user)
+    new_user = result.scalar_one()
     await db.commit()
-    await db.refresh(new_user)
     
     return new_user
 
@@ -82,10 +213,12 @@ async def register(user_data: RegisterRequest, db: AsyncSession = Depends(get_db
 @router.post("/auth/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """Authenticate user and return access token"""
-    result = await db.execute(select(User).where(User.username == form_data.username))
+    result = await db.execute(_USER_BY_USERNAME_STMT, {"username": form_data.username})
     user = result.scalar_one_or_none()
     
-    if not user or not AuthService.verify_password(form_data.password, user.hashed_password):
+    hashed_password = user.hashed_password if user else _DUMMY_HASH
+    password_ok = await _offload(_verify_password, form_data.password, hashed_password)
+    if not user or not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -98,6 +231,11 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
             detail="Inactive user"
         )
     
+    # Upgrade legacy bcrypt hashes transparently on successful login
+    if _needs_rehash(user.hashed_password):
+        user.hashed_password = await _offload(_hash_password, form_data.password)
+        await db.commit()
+    
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
     access_token = AuthService.create_access_token(
         data={"sub": user.username, "user_id": user.id},
@@ -115,11 +253,13 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 async def logout(token: str = Depends(oauth2_scheme)):
     """Logout user by blacklisting token"""
     # Add token to blacklist with expiration
+    token_key = _token_key(token)
     await redis_client.set(
-        f"blacklisted_token:{token}",
-        "true",
+        f"bl:{token_key.hex()}",
+        1,
         expire=settings.access_token_expire_minutes * 60
     )
+    _bl_negative.pop(token_key, None)
     
     return {"message": "Successfully logged out"}
 
@@ -137,13 +277,16 @@ async def change_password(
     db: AsyncSession = Depends(get_db)
 ):
     """Change user password"""
-    if not AuthService.verify_password(password_data.current_password, current_user.hashed_password):
+    if not await _offload(
+        _verify_password, password_data.current_password, current_user.hashed_password
+    ):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Current password is incorrect"
         )
     
-    current_user.hashed_password = AuthService.get_password_hash(password_data.new_password)
+    current_user.hashed_password = await _offload(_hash_password, password_data.new_password)
     await db.commit()
+    invalidate_cached_user(current_user.id)
     
     return {"message": "Password changed successfully"}
\ No newline at end of file
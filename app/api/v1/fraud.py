@@ -1,17 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
+from types import SimpleNamespace
 
 from app.core.database import get_db
-from app.models.user import User
-from app.api.v1.auth import get_current_user
+from app.api.v1.auth import get_current_user_snapshot
 
 router = APIRouter()
 
 
 @router.get("/fraud/risk-score")
 async def get_user_risk_score(
-    current_user: User = Depends(get_current_user),
+    current_user: SimpleNamespace = Depends(get_current_user_snapshot),
     db: AsyncSession = Depends(get_db)
 ):
     """Get current user's risk score"""
@@ -39,7 +39,7 @@ async def get_user_risk_score(
 
 @router.get("/fraud/stats")
 async def get_fraud_stats(
-    current_user: User = Depends(get_current_user),
+    current_user: SimpleNamespace = Depends(get_current_user_snapshot),
     db: AsyncSession = Depends(get_db)
 ):
     """Get fraud statistics for the current user"""
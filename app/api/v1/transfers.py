@@ -1,90 +1,166 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import List
-import uuid
+from sqlalchemy import select, insert, update, func, case, and_, or_, union_all, tuple_, bindparam, Integer, DateTime
+from sqlalchemy.orm import aliased
+from typing import Optional
+from datetime import datetime
+from types import SimpleNamespace
+import base64
+import secrets
 
 from app.core.database import get_db
 from app.models.user import User
 from app.models.transfer import Transfer, TransferStatus, TransferType
-from app.schemas.transfer import TransferCreate, TransferResponse
-from app.api.v1.auth import get_current_user
+from app.schemas.transfer import TransferCreate, TransferResponse, TransferPage
+from app.api.v1.auth import get_current_user, get_current_user_snapshot, invalidate_cached_user
 from app.services.auth_service import AuthService
 
 router = APIRouter()
 
 
+def _build_transfer_page_stmt(with_cursor: bool):
+    """Build the transfers list query; all values are supplied as bind params.
+
+    Two bounded index range scans (sender/receiver, created_at) are merged in
+    SQL; self-transfers are only taken from the sender side to avoid duplicates.
+    """
+    user_id = bindparam("user_id", type_=Integer)
+    window = bindparam("window", type_=Integer)
+    sent = select(Transfer).where(Transfer.sender_id == user_id)
+    received = select(Transfer).where(Transfer.receiver_id == user_id, Transfer.sender_id != user_id)
+    if with_cursor:
+        older_than_cursor = tuple_(Transfer.created_at, Transfer.id) < tuple_(
+            bindparam("before", type_=DateTime(timezone=True)),
+            bindparam("before_id", type_=Integer),
+        )
+        sent = sent.where(older_than_cursor)
+        received = received.where(older_than_cursor)
+    sent = sent.order_by(Transfer.created_at.desc(), Transfer.id.desc()).limit(window)
+    received = received.order_by(Transfer.created_at.desc(), Transfer.id.desc()).limit(window)
+    merged = aliased(Transfer, union_all(sent, received).subquery())
+    return select(merged).order_by(merged.created_at.desc(), merged.id.desc()).limit(window)
+
+
+def _build_transfer_stats_stmt():
+    """Aggregate sent and received totals server-side in a single round trip"""
+    user_id = bindparam("user_id", type_=Integer)
+    sent = Transfer.sender_id == user_id
+    received = Transfer.receiver_id == user_id
+    completed = Transfer.status == TransferStatus.COMPLETED
+    return select(
+        func.coalesce(func.sum(case((sent, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((received, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((and_(sent, completed), Transfer.amount), else_=0)), 0),
+        func.coalesce(func.sum(case((and_(received, completed), Transfer.amount), else_=0)), 0),
+    ).where(or_(sent, received))
+
+
+# Hot-path statements are constructed once at import and hit SQLAlchemy's
+# compiled cache on every execution
+_TRANSFER_PAGE_STMT = _build_transfer_page_stmt(with_cursor=False)
+_TRANSFER_PAGE_BEFORE_CURSOR_STMT = _build_transfer_page_stmt(with_cursor=True)
+_TRANSFER_STATS_STMT = _build_transfer_stats_stmt()
+
+
 @router.post("/transfers", response_model=TransferResponse, status_code=status.HTTP_201_CREATED)
 async def create_transfer(
     transfer_data: TransferCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: SimpleNamespace = Depends(get_current_user_snapshot),
     db: AsyncSession = Depends(get_db)
 ):
     """Create a new transfer"""
-    # Validate sufficient balance
-    if current_user.balance < transfer_data.amount:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Insufficient balance"
-        )
-    
     # Validate receiver for internal transfers
-    receiver = None
+    receiver_id = None
     if transfer_data.transfer_type == TransferType.INTERNAL:
         if not transfer_data.receiver_id:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Receiver ID is required for internal transfers"
             )
-        
-        result = await db.execute(select(User).where(User.id == transfer_data.receiver_id))
-        receiver = result.scalar_one_or_none()
-        if not receiver:
+        receiver_id = transfer_data.receiver_id
+    
+    # Process transfer with conditional UPDATEs: the balance predicate on the debit
+    # enforces sufficient funds atomically, and rows are locked in id order so
+    # concurrent transfers between the same users cannot deadlock
+    amount = transfer_data.amount
+    balance_changes = [(current_user.id, -amount)]
+    if receiver_id is not None:
+        balance_changes.append((receiver_id, amount))
+    
+    for user_id, delta in sorted(balance_changes, key=lambda change: change[0]):
+        stmt = update(User).where(User.id == user_id)
+        if delta < 0:
+            stmt = stmt.where(User.balance >= -delta)
+        result = await db.execute(
+            stmt.values(balance=User.balance + delta).returning(User.id)
+        )
+        if result.scalar_one_or_none() is None:
+            await db.rollback()
+            if delta < 0:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Insufficient balance"
+                )
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Receiver not found"
             )
     
-    # Create transfer
-    transfer = Transfer(
-        reference_id=f"TXN-{uuid.uuid4().hex[:12].upper()}",
-        sender_id=current_user.id,
-        receiver_id=transfer_data.receiver_id,
-        receiver_external_id=transfer_data.receiver_external_id,
-        amount=transfer_data.amount,
-        currency=transfer_data.currency,
-        description=transfer_data.description,
-        transfer_type=transfer_data.transfer_type,
-        status=TransferStatus.COMPLETED,  # Simplified for demo
-        fraud_score=0.1  # Basic fraud score
+    # Create transfer; RETURNING loads server defaults without a follow-up SELECT
+    result = await db.execute(
+        insert(Transfer).values(
+            reference_id=f"TXN-{base64.b32encode(secrets.token_bytes(10)).decode()}",  # 80 random bits
+            sender_id=current_user.id,
+            receiver_id=transfer_data.receiver_id,
+            receiver_external_id=transfer_data.receiver_external_id,
+            amount=transfer_data.amount,
+            currency=transfer_data.currency,
+            description=transfer_data.description,
+            transfer_type=transfer_data.transfer_type,
+            status=TransferStatus.COMPLETED,  # Simplified for demo
+            fraud_score=0.1  # Basic fraud score
+        ).returning(Transfer)
     )
-    
-    # Process transfer (simplified)
-    current_user.balance -= transfer_data.amount
-    if receiver:
-        receiver.balance += transfer_data.amount
-    
-    db.add(transfer)
+    transfer = result.scalar_one()
     await db.commit()
-    await db.refresh(transfer)
+    invalidate_cached_user(current_user.id)
+    if receiver_id is not None:
+        invalidate_cached_user(receiver_id)
     
     return transfer
 
 
-@router.get("/transfers", response_model=List[TransferResponse])
+@router.get("/transfers", response_model=TransferPage)
 async def get_transfers(
-    current_user: User = Depends(get_current_user),
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    current_user: SimpleNamespace = Depends(get_current_user_snapshot),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get user's transfers"""
-    result = await db.execute(
-        select(Transfer).where(
-            (Transfer.sender_id == current_user.id) | 
-            (Transfer.receiver_id == current_user.id)
-        ).order_by(Transfer.created_at.desc())
-    )
+    """Get user's transfers, newest first, paginated by (created_at, id) cursor"""
+    if (before is None) != (before_id is None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="before and before_id must be provided together"
+        )
+    
+    # One extra row is fetched to tell whether another page exists
+    params = {"user_id": current_user.id, "window": limit + 1}
+    if before is None:
+        result = await db.execute(_TRANSFER_PAGE_STMT, params)
+    else:
+        params.update(before=before, before_id=before_id)
+        result = await db.execute(_TRANSFER_PAGE_BEFORE_CURSOR_STMT, params)
     transfers = result.scalars().all()
-    return transfers
+    
+    next_cursor = None
+    if len(transfers) > limit:
+        transfers = transfers[:limit]
+        last = transfers[-1]
+        next_cursor = {"before": last.created_at, "before_id": last.id}
+    
+    return {"items": transfers, "next_cursor": next_cursor}
 
 
 @router.get("/transfers/stats/summary")
@@ -93,26 +169,14 @@ async def get_transfer_stats(
     db: AsyncSession = Depends(get_db)
 ):
     """Get transfer statistics for the current user"""
-    # Get sent transfers
-    sent_result = await db.execute(
-        select(Transfer).where(Transfer.sender_id == current_user.id)
-    )
-    sent_transfers = sent_result.scalars().all()
-    
-    # Get received transfers  
-    received_result = await db.execute(
-        select(Transfer).where(Transfer.receiver_id == current_user.id)
-    )
-    received_transfers = received_result.scalars().all()
-    
-    total_sent = sum(t.amount for t in sent_transfers if t.status == TransferStatus.COMPLETED)
-    total_received = sum(t.amount for t in received_transfers if t.status == TransferStatus.COMPLETED)
+    result = await db.execute(_TRANSFER_STATS_STMT, {"user_id": current_user.id})
+    sent_count, received_count, total_sent, total_received = result.one()
     
     return {
         "current_balance": current_user.balance,
         "total_sent": total_sent,
         "total_received": total_received,
-        "total_transactions": len(sent_transfers) + len(received_transfers),
-        "sent_count": len(sent_transfers),
-        "received_count": len(received_transfers)
+        "total_transactions": sent_count + received_count,
+        "sent_count": sent_count,
+        "received_count": received_count
     }
\ No newline at end of file
@@ -1,17 +1,34 @@
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
 from app.core.config import settings
 
+
+def _pool_kwargs(database_url: str) -> dict:
+    """Queue-pool sizing, only for dialects that actually use a QueuePool"""
+    url = make_url(database_url)
+    if not issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+        # e.g. sqlite+aiosqlite uses NullPool, which rejects pool_size/max_overflow
+        return {}
+    return {"pool_size": settings.db_pool_size, "max_overflow": settings.db_max_overflow}
+
+
 engine = create_async_engine(
     settings.database_url,
     echo=settings.debug,
-    future=True
+    future=True,
+    # Recycling bounds connection age, so the per-checkout ping can stay off
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=settings.db_pool_pre_ping,
+    **_pool_kwargs(settings.database_url)
 )
 
 AsyncSessionLocal = async_sessionmaker(
     engine,
     class_=AsyncSession,
-    expire_on_commit=False
+    expire_on_commit=False,
+    autoflush=False
 )
 
 Base = declarative_base()
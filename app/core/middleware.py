@@ -3,34 +3,62 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 from loguru import logger
+import itertools
+import os
+import sys
 import time
-import uuid
+
+from app.core.config import settings
+
+# Request ids are unique per worker process: "<pid>-<sequence>" in hex
+_REQ_COUNTER = itertools.count()
+_PREFIX = f"{os.getpid():x}"
 
 
 class LoggingMiddleware(BaseHTTPMiddleware):
     """Request logging middleware"""
     
     async def dispatch(self, request: Request, call_next):
-        request_id = str(uuid.uuid4())
-        start_time = time.time()
+        request_id = f"{_PREFIX}-{next(_REQ_COUNTER):x}"
+        start_time = time.perf_counter()
+        log = logger.bind(request_id=request_id, method=request.method, path=request.url.path)
         
-        # Log request
-        logger.info(
-            f"Request {request_id}: {request.method} {request.url} from {request.client.host if request.client else 'unknown'}"
+        # Log request (structured fields, so nothing is formatted when DEBUG is filtered)
+        log.debug(
+            "request",
+            client=request.client.host if request.client else "unknown"
         )
         
         response = await call_next(request)
         
-        # Log response
-        duration = time.time() - start_time
-        logger.info(
-            f"Response {request_id}: {response.status_code} in {duration:.4f}s"
+        # Log response: DEBUG like the request line, but server errors still
+        # surface at the default level
+        duration = time.perf_counter() - start_time
+        log.log(
+            "WARNING" if response.status_code >= 500 else "DEBUG",
+            "response",
+            status_code=response.status_code,
+            duration=round(duration, 4),
         )
         
         response.headers["X-Request-ID"] = request_id
         return response
 
 
+def setup_logging():
+    """Configure loguru with a non-blocking sink"""
+    logger.remove()
+    # enqueue=True hands records to a background writer thread so request
+    # handlers never block on stderr
+    logger.add(
+        sys.stderr,
+        level="DEBUG" if settings.debug else settings.log_level,
+        format="{time:YYYY-MM-DD HH:mm:ss.SSS} | {level: <8} | {name}:{function}:{line} - {message} {extra}",
+        enqueue=True,
+        serialize=not settings.debug,
+    )
+
+
 def setup_middleware(app: FastAPI):
     """Setup application middleware"""
     
@@ -1,7 +1,8 @@
 import redis.asyncio as redis
 from app.core.config import settings
-from typing import Optional, Any
+from typing import Optional, Any, List, Sequence, Tuple
 import json
+import msgpack
 from loguru import logger
 
 
@@ -10,6 +11,8 @@ class RedisClient:
     
     def __init__(self, url: str):
         self.redis = redis.from_url(url, encoding="utf-8", decode_responses=True)
+        # Binary client for msgpack-encoded cache payloads (no UTF-8 decode on reads)
+        self.raw = redis.from_url(url, decode_responses=False)
     
     async def get(self, key: str) -> Optional[str]:
         """Get value by key"""
@@ -19,6 +22,51 @@ class RedisClient:
             logger.error(f"Redis GET error for key {key}: {e}")
             return None
     
+    async def exists(self, key: str) -> Optional[bool]:
+        """Check whether a key exists without transferring its value (None on error)"""
+        try:
+            return bool(await self.redis.exists(key))
+        except Exception as e:
+            logger.error(f"Redis EXISTS error for key {key}: {e}")
+            return None
+    
+    async def get_packed(self, key: str) -> Optional[Any]:
+        """Get a msgpack-encoded value"""
+        try:
+            value = await self.raw.get(key)
+            return msgpack.unpackb(value) if value is not None else None
+        except Exception as e:
+            logger.error(f"Redis GET error for key {key}: {e}")
+            return None
+    
+    async def set_packed(self, key: str, value: Any, expire: Optional[int] = None) -> bool:
+        """Set a value encoded with msgpack, with optional expiration"""
+        try:
+            result = await self.raw.set(key, msgpack.packb(value), ex=expire)
+            return bool(result)
+        except Exception as e:
+            logger.error(f"Redis SET error for key {key}: {e}")
+            return False
+    
+    async def mget(self, keys: List[str]) -> List[Optional[str]]:
+        """Get values for several keys in a single round trip"""
+        try:
+            return await self.redis.mget(keys)
+        except Exception as e:
+            logger.error(f"Redis MGET error for keys {keys}: {e}")
+            return [None] * len(keys)
+    
+    async def pipeline_exec(self, ops: Sequence[Tuple[Any, ...]]) -> List[Any]:
+        """Execute commands such as ("get", key) in one non-transactional pipeline"""
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for command, *args in ops:
+                    getattr(pipe, command)(*args)
+                return await pipe.execute()
+        except Exception as e:
+            logger.error(f"Redis pipeline error: {e}")
+            return [None] * len(ops)
+    
     async def set(self, key: str, value: Any, expire: Optional[int] = None) -> bool:
         """Set key-value pair with optional expiration"""
         try:
@@ -39,6 +87,28 @@ class RedisClient:
             logger.error(f"Redis DELETE error for key {key}: {e}")
             return False
     
+    async def delete_by_prefix(self, prefix: str, batch_size: int = 500) -> int:
+        """Unlink all keys starting with prefix, batching deletes per pipeline"""
+        deleted = 0
+        try:
+            batch = []
+            async for key in self.redis.scan_iter(match=f"{prefix}*", count=batch_size):
+                batch.append(key)
+                if len(batch) >= batch_size:
+                    deleted += await self._unlink_batch(batch)
+                    batch = []
+            if batch:
+                deleted += await self._unlink_batch(batch)
+        except Exception as e:
+            logger.error(f"Redis delete by prefix error for {prefix}: {e}")
+        return deleted
+    
+    async def _unlink_batch(self, keys: List[str]) -> int:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.unlink(key)
+            return sum(await pipe.execute())
+    
     async def incr(self, key: str, amount: int = 1) -> Optional[int]:
         """Increment key value"""
         try:
@@ -67,6 +137,7 @@ class RedisClient:
     async def close(self):
         """Close Redis connection"""
         await self.redis.close()
+        await self.raw.close()
 
 
 redis_client = RedisClient(settings.redis_url)
\ No newline at end of file
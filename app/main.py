@@ -1,15 +1,20 @@
 from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
+from sqlalchemy import text
+import time
 
 from app.core.config import settings
 from app.core.database import engine, Base
 from app.core.redis_client import redis_client
 from app.api.v1 import auth, transfers, fraud
-from app.core.middleware import setup_middleware
+from app.core.middleware import setup_logging, setup_middleware
 from loguru import logger
 
+setup_logging()
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
@@ -33,12 +38,14 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     # Shutdown
     logger.info("Shutting down...")
     await redis_client.close()
+    await logger.complete()
 
 
 app = FastAPI(
     title="Fraud Detection Transfer System",
     description="A sophisticated fraud detection and money transfer system",
     version="0.1.0",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -56,18 +63,36 @@ async def root():
     return {"message": "Fraud Detection Transfer System API", "version": "0.1.0"}
 
 
+# Health probes are scraped frequently; reuse each dependency check for a short window
+_HEALTH_CACHE_SECONDS = 2.0
+_health_checked_at = {"redis": float("-inf"), "database": float("-inf")}
+_health_status = {"redis": "unknown", "database": "unknown"}
+
+
+async def _check_database() -> bool:
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+    return True
+
+
+async def _cached_status(name: str, check) -> str:
+    """Return the last known status of a dependency, refreshing it when stale"""
+    now = time.monotonic()
+    if now - _health_checked_at[name] >= _HEALTH_CACHE_SECONDS:
+        try:
+            healthy = await check()
+        except Exception:
+            healthy = False
+        _health_status[name] = "healthy" if healthy else "unhealthy"
+        _health_checked_at[name] = now
+    return _health_status[name]
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    try:
-        # Check Redis
-        await redis_client.ping()
-        redis_status = "healthy"
-    except Exception:
-        redis_status = "unhealthy"
-    
     return {
         "status": "healthy",
-        "redis": redis_status,
-        "database": "healthy"
+        "redis": await _cached_status("redis", redis_client.ping),
+        "database": await _cached_status("database", _check_database)
     }
\ No newline at end of file
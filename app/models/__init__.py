@@ -0,0 +1,6 @@
+# Import every model so relationship() targets resolve when mappers configure
+from app.models.user import User, UserProfile
+from app.models.transfer import Transfer
+from app.models.fraud import FraudReport, FraudPattern, UserBehavior
+
+__all__ = ["User", "UserProfile", "Transfer", "FraudReport", "FraudPattern", "UserBehavior"]
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Float, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Float, ForeignKey, Enum, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.core.database import Base
@@ -23,6 +23,11 @@ class TransferType(str, enum.Enum):
 
 class Transfer(Base):
     __tablename__ = "transfers"
+    __table_args__ = (
+        # Per-user history scans in (created_at, id) keyset order
+        Index("ix_transfers_sender_created", "sender_id", "created_at", "id"),
+        Index("ix_transfers_receiver_created", "receiver_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     reference_id = Column(String, unique=True, index=True, nullable=False)
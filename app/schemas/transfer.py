@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from app.models.transfer import TransferStatus, TransferType
 
@@ -28,4 +28,14 @@ class TransferResponse(TransferBase):
     created_at: datetime
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class TransferCursor(BaseModel):
+    before: datetime
+    before_id: int
+
+
+class TransferPage(BaseModel):
+    items: List[TransferResponse]
+    next_cursor: Optional[TransferCursor] = None
\ No newline at end of file
@@ -6,67 +6,196 @@ This script runs basic performance tests against the fraud detection API.
 For more comprehensive testing, consider using tools like Locust or Artillery.
 """
 
+import argparse
 import asyncio
+import functools
+import random
 import time
-import statistics
-from typing import List
+from typing import Optional, Tuple
 import httpx
 import json
+import numpy as np
+
+
+# Above this many requests per endpoint, percentiles are estimated with t-digest
+# (constant memory) unless exact results are requested
+DIGEST_THRESHOLD = 10_000
+
+
+class Recorder:
+    """Counts requests that failed before getting a response, keeping the first error."""
+    
+    def __init__(self):
+        self.errors = 0
+        self.first_error = None
+    
+    def _add_error(self, error: Optional[str]):
+        if error is not None:
+            self.errors += 1
+            if self.first_error is None:
+                self.first_error = error
+
+
+class ExactRecorder(Recorder):
+    """Buffers every sample in numpy arrays for exact percentiles."""
+    
+    def __init__(self, capacity: int = 1024):
+        super().__init__()
+        self._durations_ns = np.empty(max(capacity, 1), dtype=np.int64)
+        self._status_codes = np.empty(max(capacity, 1), dtype=np.int16)
+        self._count = 0
+    
+    def add(self, duration_ns: int, status_code: int, error: Optional[str] = None):
+        self._add_error(error)
+        if self._count == self._durations_ns.size:
+            self._durations_ns = np.resize(self._durations_ns, self._count * 2)
+            self._status_codes = np.resize(self._status_codes, self._count * 2)
+        self._durations_ns[self._count] = duration_ns
+        self._status_codes[self._count] = status_code
+        self._count += 1
+    
+    def summary(self) -> dict:
+        status_codes = self._status_codes[:self._count]
+        succeeded = (status_codes >= 200) & (status_codes < 400)
+        # Durations are recorded in integer nanoseconds and only converted here
+        durations = self._durations_ns[:self._count][succeeded] / 1e6
+        summary = {"total": self._count, "successes": int(durations.size)}
+        if durations.size:
+            p50, p95, p99, p999 = np.percentile(durations, [50, 95, 99, 99.9])
+            summary.update(
+                mean=float(durations.mean()),
+                min=float(durations.min()),
+                max=float(durations.max()),
+                p50=float(p50), p95=float(p95), p99=float(p99), p999=float(p999)
+            )
+        return summary
+
+
+class DigestRecorder(Recorder):
+    """Estimates percentiles online with a t-digest, in constant memory."""
+    
+    def __init__(self):
+        from tdigest import TDigest
+        
+        super().__init__()
+        self._digest = TDigest()
+        self._count = 0
+        self._successes = 0
+        self._sum_ms = 0.0
+        self._min_ms = float("inf")
+        self._max_ms = float("-inf")
+    
+    def add(self, duration_ns: int, status_code: int, error: Optional[str] = None):
+        self._add_error(error)
+        self._count += 1
+        if not 200 <= status_code < 400:
+            return
+        duration_ms = duration_ns / 1e6
+        self._digest.update(duration_ms)
+        self._successes += 1
+        self._sum_ms += duration_ms
+        self._min_ms = min(self._min_ms, duration_ms)
+        self._max_ms = max(self._max_ms, duration_ms)
+    
+    def summary(self) -> dict:
+        summary = {"total": self._count, "successes": self._successes}
+        if self._successes:
+            summary.update(
+                mean=self._sum_ms / self._successes,
+                min=self._min_ms,
+                max=self._max_ms,
+                p50=self._digest.percentile(50),
+                p95=self._digest.percentile(95),
+                p99=self._digest.percentile(99),
+                p999=self._digest.percentile(99.9)
+            )
+        return summary
 
 
 class PerformanceTest:
-    def __init__(self, base_url: str = "http://localhost:8000"):
+    def __init__(self,
+                 base_url: str = "http://localhost:8000",
+                 max_concurrent: int = 20,
+                 http2: bool = False,
+                 target_rps: Optional[float] = None,
+                 duration: float = 60.0,
+                 trim_seconds: float = 10.0,
+                 exact: bool = False,
+                 warmup_requests: Optional[int] = None):
         self.base_url = base_url
         self.results = []
+        self.max_concurrent = max_concurrent
+        self.http2 = http2
+        # Open-loop mode (Poisson arrivals) when target_rps is set, else closed-loop
+        self.target_rps = target_rps
+        self.duration = duration
+        self.trim_seconds = trim_seconds
+        # Force exact percentiles even for runs above DIGEST_THRESHOLD
+        self.exact = exact
+        # Closed-loop warmup size; None means max(concurrent * 2, 20), 0 disables it
+        self.warmup_requests = warmup_requests
+        self._client = None
     
-    async def get_auth_token(self) -> str:
-        """Get authentication token for testing."""
-        async with httpx.AsyncClient() as client:
-            # Login with test user (assuming seeded database)
-            response = await client.post(
-                f"{self.base_url}/api/v1/auth/token",
-                data={"username": "alice", "password": "password123"},
-                headers={"Content-Type": "application/x-www-form-urlencoded"}
+    def _get_client(self) -> httpx.AsyncClient:
+        """Return the shared client, creating it on first use.
+        
+        Reusing one client keeps connections alive between requests, so timings
+        measure the server rather than TCP/TLS handshakes. With http2 enabled
+        (requires ``httpx[http2]``), requests are multiplexed over a few
+        connections when the server negotiates HTTP/2 via TLS ALPN.
+        """
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrent * 2,
+                    max_keepalive_connections=self.max_concurrent
+                ),
+                timeout=30
             )
-            if response.status_code == 200:
-                return response.json()["access_token"]
-            else:
-                raise Exception(f"Failed to get auth token: {response.status_code}")
+        return self._client
+    
+    async def close(self):
+        """Close the shared client."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
     
-    async def measure_request(self, method: str, url: str, **kwargs) -> dict:
-        """Measure a single HTTP request."""
-        start_time = time.time()
+    async def get_auth_token(self) -> str:
+        """Get authentication token for testing.
         
-        async with httpx.AsyncClient() as client:
-            try:
-                if method.upper() == "GET":
-                    response = await client.get(url, **kwargs)
-                elif method.upper() == "POST":
-                    response = await client.post(url, **kwargs)
-                elif method.upper() == "PATCH":
-                    response = await client.patch(url, **kwargs)
-                else:
-                    raise ValueError(f"Unsupported method: {method}")
-                
-                end_time = time.time()
-                duration = (end_time - start_time) * 1000  # Convert to milliseconds
-                
-                return {
-                    "duration_ms": duration,
-                    "status_code": response.status_code,
-                    "success": 200 <= response.status_code < 400,
-                    "response_size": len(response.content)
-                }
-            except Exception as e:
-                end_time = time.time()
-                duration = (end_time - start_time) * 1000
-                return {
-                    "duration_ms": duration,
-                    "status_code": 0,
-                    "success": False,
-                    "error": str(e),
-                    "response_size": 0
-                }
+        Logs in over the shared client (warming its pool) and attaches the token
+        to it, so every later request is authenticated without extra headers.
+        """
+        client = self._get_client()
+        # Login with test user (assuming seeded database)
+        response = await client.post(
+            f"{self.base_url}/api/v1/auth/token",
+            data={"username": "alice", "password": "password123"},
+            headers={"Content-Type": "application/x-www-form-urlencoded"}
+        )
+        if response.status_code == 200:
+            token = response.json()["access_token"]
+            client.headers["Authorization"] = f"Bearer {token}"
+            return token
+        else:
+            raise Exception(f"Failed to get auth token: {response.status_code}")
+    
+    async def measure_request(self, send) -> Tuple[int, int, Optional[str]]:
+        """Measure a single HTTP request made by the pre-bound `send` callable.
+        
+        Returns (duration_ns, status_code, error); requests that raise get
+        status 0 and the exception text as error.
+        """
+        start_ns = time.perf_counter_ns()
+        
+        try:
+            # client.request reads the whole body, so timings include the
+            # transfer and the connection goes back to the keep-alive pool
+            response = await send()
+            return time.perf_counter_ns() - start_ns, response.status_code, None
+        except Exception as e:
+            return time.perf_counter_ns() - start_ns, 0, str(e)
     
     async def test_endpoint_performance(self, 
                                       name: str,
@@ -74,32 +203,56 @@ class PerformanceTest:
                                       endpoint: str,
                                       num_requests: int = 100,
                                       concurrent: int = 10,
+                                      warmup: bool = True,
+                                      open_loop: bool = True,
                                       **kwargs) -> dict:
-        """Test performance of a specific endpoint."""
+        """Test performance of a specific endpoint.
+        
+        With open_loop=False the test always runs closed-loop with exactly
+        num_requests requests, even when target_rps is set.
+        """
         print(f"\nTesting {name}...")
-        print(f"Requests: {num_requests}, Concurrent: {concurrent}")
+        open_loop = open_loop and bool(self.target_rps)
+        if open_loop:
+            print(f"Target RPS: {self.target_rps}, Duration: {self.duration}s (open loop)")
+            expected_requests = int(self.target_rps * self.duration)
+        else:
+            print(f"Requests: {num_requests}, Concurrent: {concurrent}")
+            expected_requests = num_requests
+        recorder = self._make_recorder(expected_requests)
         
         url = f"{self.base_url}{endpoint}"
+        client = self._get_client()
         
-        # Create semaphore to limit concurrent requests
-        semaphore = asyncio.Semaphore(concurrent)
+        # Resolve the method and freeze the request arguments once per test
+        send = functools.partial(client.request, method.upper(), url, **kwargs)
+        make_call = functools.partial(self.measure_request, send)
         
-        async def make_request():
-            async with semaphore:
-                return await self.measure_request(method, url, **kwargs)
-        
-        # Run all requests
-        start_time = time.time()
-        tasks = [make_request() for _ in range(num_requests)]
-        results = await asyncio.gather(*tasks)
-        total_time = time.time() - start_time
+        if open_loop:
+            # Open-loop runs discard their first trim_seconds instead
+            total_time = await self._run_open_loop(make_call, recorder)
+        else:
+            if warmup:
+                # Warm connections and server-side caches; these samples are dropped
+                warmup_requests = self.warmup_requests
+                if warmup_requests is None:
+                    warmup_requests = max(concurrent * 2, 20)
+                if warmup_requests:
+                    await self._run_closed_loop(
+                        make_call, ExactRecorder(warmup_requests), warmup_requests, concurrent
+                    )
+            total_time = await self._run_closed_loop(make_call, recorder, num_requests, concurrent)
         
         # Analyze results
-        durations = [r["duration_ms"] for r in results if r["success"]]
-        successes = sum(1 for r in results if r["success"])
-        failures = len(results) - successes
+        summary = recorder.summary()
+        num_requests = summary["total"]
+        successes = summary["successes"]
+        failures = num_requests - successes
+        # Open-loop arrivals are paced by target_rps, so counting them would only
+        # report the offered rate; count completed successes instead
+        completed = successes if open_loop else num_requests
         
-        if durations:
+        if successes:
             stats = {
                 "test_name": name,
                 "endpoint": endpoint,
@@ -108,13 +261,16 @@ class PerformanceTest:
                 "failed_requests": failures,
                 "success_rate": successes / num_requests * 100,
                 "total_time_seconds": total_time,
-                "requests_per_second": num_requests / total_time,
-                "avg_response_time_ms": statistics.mean(durations),
-                "min_response_time_ms": min(durations),
-                "max_response_time_ms": max(durations),
-                "median_response_time_ms": statistics.median(durations),
-                "p95_response_time_ms": self.percentile(durations, 95),
-                "p99_response_time_ms": self.percentile(durations, 99)
+                "requests_per_second": completed / total_time,
+                "avg_response_time_ms": summary["mean"],
+                "min_response_time_ms": summary["min"],
+                "max_response_time_ms": summary["max"],
+                "median_response_time_ms": summary["p50"],
+                "p95_response_time_ms": summary["p95"],
+                "p99_response_time_ms": summary["p99"],
+                "p999_response_time_ms": summary["p999"],
+                "client_errors": recorder.errors,
+                "first_client_error": recorder.first_error
             }
         else:
             stats = {
@@ -126,34 +282,96 @@ class PerformanceTest:
                 "success_rate": 0,
                 "error": "All requests failed"
             }
+            if recorder.first_error is not None:
+                stats["error"] += f" ({recorder.errors} errors, first: {recorder.first_error})"
         
         self.results.append(stats)
         self.print_test_results(stats)
         return stats
     
-    def percentile(self, data: List[float], percentile: float) -> float:
-        """Calculate percentile of a list."""
-        if not data:
-            return 0
+    def _make_recorder(self, expected_requests: int):
+        """Pick exact buffering for normal runs and t-digest for very long ones."""
+        if self.exact or expected_requests <= DIGEST_THRESHOLD:
+            return ExactRecorder(capacity=expected_requests)
+        return DigestRecorder()
+    
+    async def _run_closed_loop(self, make_call, recorder, num_requests: int, concurrent: int) -> float:
+        """Run num_requests calls with a pool of `concurrent` long-lived workers."""
+        # Workers pull from one shared iterator; the loop is single-threaded, so
+        # no locking is needed and only `concurrent` tasks ever exist
+        remaining = iter(range(num_requests))
         
-        sorted_data = sorted(data)
-        k = (len(sorted_data) - 1) * (percentile / 100)
-        f = int(k)
-        c = k - f
+        async def worker():
+            for _ in remaining:
+                recorder.add(*await make_call())
         
-        if f == len(sorted_data) - 1:
-            return sorted_data[f]
+        # Run all requests
+        start_ns = time.perf_counter_ns()
+        async with asyncio.TaskGroup() as tg:
+            for _ in range(min(concurrent, num_requests)):
+                tg.create_task(worker())
+        return (time.perf_counter_ns() - start_ns) / 1e9
+    
+    async def _run_open_loop(self, make_call, recorder) -> float:
+        """Send requests with Poisson arrivals at target_rps for the test duration.
+        
+        Arrivals never wait for earlier responses, so queueing delay shows up in
+        the latencies instead of throttling the offered load. Requests sent in the
+        first and last trim_seconds are discarded as warmup/cooldown.
+        
+        Returns the time from the first counted send to the last counted
+        completion, so rates computed from it reflect achieved throughput.
+        """
+        if self.duration > 2 * self.trim_seconds:
+            window_start, window_end = self.trim_seconds, self.duration - self.trim_seconds
         else:
-            return sorted_data[f] * (1 - c) + sorted_data[f + 1] * c
+            window_start, window_end = 0.0, self.duration
+        
+        first_sent_at = last_done_at = None
+        
+        async def make_request(counted: bool):
+            nonlocal first_sent_at, last_done_at
+            sent_at = time.perf_counter()
+            result = await make_call()
+            if counted:
+                recorder.add(*result)
+                # Responses can arrive out of order, so keep the earliest send
+                if first_sent_at is None or sent_at < first_sent_at:
+                    first_sent_at = sent_at
+                last_done_at = time.perf_counter()
+        
+        # Only in-flight tasks are kept alive
+        pending = set()
+        # Arrivals are scheduled on absolute times, so sleep overshoot and loop lag
+        # are caught up on rather than accumulating into a lower offered rate
+        next_at = 0.0
+        loop_start = time.perf_counter()
+        while next_at < self.duration:
+            await asyncio.sleep(max(0.0, next_at - (time.perf_counter() - loop_start)))
+            task = asyncio.create_task(make_request(window_start <= next_at < window_end))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            next_at += random.expovariate(self.target_rps)
+        await asyncio.gather(*pending)
+        if first_sent_at is None:
+            return 0.0
+        return last_done_at - first_sent_at
     
     def print_test_results(self, stats: dict):
-        """Print formatted test results."""
+        """Print formatted test results.
+        
+        Concurrent tests finish in any order, so each block names its test.
+        """
+        print(f"\n{stats['test_name']} ({stats['endpoint']}):")
         print(f"  ✓ Success Rate: {stats.get('success_rate', 0):.1f}%")
         if 'avg_response_time_ms' in stats:
             print(f"  ✓ Avg Response Time: {stats['avg_response_time_ms']:.2f}ms")
             print(f"  ✓ P95 Response Time: {stats['p95_response_time_ms']:.2f}ms")
             print(f"  ✓ P99 Response Time: {stats['p99_response_time_ms']:.2f}ms")
+            print(f"  ✓ P99.9 Response Time: {stats['p999_response_time_ms']:.2f}ms")
             print(f"  ✓ Requests/Second: {stats['requests_per_second']:.2f}")
+            if stats['client_errors']:
+                print(f"  ✗ Client Errors: {stats['client_errors']} (first: {stats['first_client_error']})")
     
     def print_summary(self):
         """Print overall test summary."""
@@ -169,14 +387,21 @@ class PerformanceTest:
                 print(f"\n✅ {result['test_name']}")
                 print(f"   Success Rate: {result['success_rate']:.1f}%")
                 print(f"   Avg Response: {result.get('avg_response_time_ms', 0):.2f}ms")
+                print(f"   P50/P95/P99/P99.9: {result['median_response_time_ms']:.2f}/"
+                      f"{result['p95_response_time_ms']:.2f}/{result['p99_response_time_ms']:.2f}/"
+                      f"{result['p999_response_time_ms']:.2f}ms")
                 print(f"   RPS: {result.get('requests_per_second', 0):.2f}")
         
         # Overall statistics
         successful_tests = [r for r in self.results if 'error' not in r]
         if successful_tests:
-            avg_success_rate = statistics.mean([r['success_rate'] for r in successful_tests])
-            avg_response_time = statistics.mean([r.get('avg_response_time_ms', 0) for r in successful_tests])
-            total_rps = sum([r.get('requests_per_second', 0) for r in successful_tests])
+            metrics = np.array(
+                [[r['success_rate'], r['avg_response_time_ms'], r['requests_per_second']]
+                 for r in successful_tests],
+                dtype=np.float64
+            )
+            avg_success_rate, avg_response_time, _ = metrics.mean(axis=0)
+            total_rps = metrics[:, 2].sum()
             
             print(f"\n📊 OVERALL METRICS")
             print(f"   Tests Passed: {len(successful_tests)}/{len(self.results)}")
@@ -185,69 +410,83 @@ class PerformanceTest:
             print(f"   Combined RPS: {total_rps:.2f}")
 
 
-async def main():
+READ_TESTS = [
+    # Health endpoint (no auth required)
+    {"name": "Health Check", "method": "GET", "endpoint": "/health",
+     "num_requests": 50, "concurrent": 10},
+    {"name": "User Profile", "method": "GET", "endpoint": "/api/v1/auth/me",
+     "num_requests": 100, "concurrent": 20},
+    {"name": "Transfers List", "method": "GET", "endpoint": "/api/v1/transfers",
+     "num_requests": 100, "concurrent": 15},
+    {"name": "Transfer Statistics", "method": "GET", "endpoint": "/api/v1/transfers/stats/summary",
+     "num_requests": 50, "concurrent": 10},
+    {"name": "Fraud Risk Score", "method": "GET", "endpoint": "/api/v1/fraud/risk-score",
+     "num_requests": 75, "concurrent": 15},
+]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run performance tests against the API.")
+    parser.add_argument("--base-url", default="http://localhost:8000", help="API base URL")
+    parser.add_argument("--http2", action="store_true",
+                        help="Enable HTTP/2 on the client (needs httpx[http2] and a TLS endpoint)")
+    parser.add_argument("--target-rps", type=float, default=None,
+                        help="Use an open-loop Poisson load at this rate instead of fixed request counts")
+    parser.add_argument("--duration", type=float, default=60.0,
+                        help="Seconds per endpoint in open-loop mode")
+    parser.add_argument("--trim-seconds", type=float, default=10.0,
+                        help="Seconds discarded at the start and end of open-loop runs")
+    parser.add_argument("--warmup-requests", type=int, default=None,
+                        help="Unmeasured requests before each closed-loop test "
+                             "(default: max(2 * concurrent, 20); 0 disables)")
+    parser.add_argument("--sequential", action="store_true",
+                        help="Run read-only endpoint tests one at a time instead of concurrently")
+    parser.add_argument("--exact", action="store_true",
+                        help=f"Keep every sample for exact percentiles above {DIGEST_THRESHOLD} requests "
+                             "(default: t-digest estimates)")
+    return parser.parse_args()
+
+
+async def main(args: argparse.Namespace):
     """Run performance tests."""
-    tester = PerformanceTest()
+    tester = PerformanceTest(
+        base_url=args.base_url,
+        # Size the connection pool for all read tests running at once
+        max_concurrent=sum(spec["concurrent"] for spec in READ_TESTS),
+        http2=args.http2,
+        target_rps=args.target_rps,
+        duration=args.duration,
+        trim_seconds=args.trim_seconds,
+        exact=args.exact,
+        warmup_requests=args.warmup_requests
+    )
     
     print("🚀 Starting Performance Tests...")
     print("Make sure the application is running and database is seeded!")
     
     try:
+        if args.http2:
+            response = await tester._get_client().get(f"{tester.base_url}/health")
+            print(f"\n🔌 Negotiated protocol: {response.http_version}")
+        
         # Get auth token
         print("\n🔐 Getting authentication token...")
-        token = await tester.get_auth_token()
-        auth_headers = {"Authorization": f"Bearer {token}"}
-        
-        # Test health endpoint (no auth required)
-        await tester.test_endpoint_performance(
-            name="Health Check",
-            method="GET",
-            endpoint="/health",
-            num_requests=50,
-            concurrent=10
-        )
+        await tester.get_auth_token()
         
-        # Test authentication endpoint
-        await tester.test_endpoint_performance(
-            name="User Profile",
-            method="GET",
-            endpoint="/api/v1/auth/me",
-            num_requests=100,
-            concurrent=20,
-            headers=auth_headers
-        )
-        
-        # Test transfers list endpoint
-        await tester.test_endpoint_performance(
-            name="Transfers List",
-            method="GET",
-            endpoint="/api/v1/transfers",
-            num_requests=100,
-            concurrent=15,
-            headers=auth_headers
-        )
-        
-        # Test transfer statistics
-        await tester.test_endpoint_performance(
-            name="Transfer Statistics",
-            method="GET",
-            endpoint="/api/v1/transfers/stats/summary",
-            num_requests=50,
-            concurrent=10,
-            headers=auth_headers
-        )
-        
-        # Test fraud risk score
-        await tester.test_endpoint_performance(
-            name="Fraud Risk Score",
-            method="GET",
-            endpoint="/api/v1/fraud/risk-score",
-            num_requests=75,
-            concurrent=15,
-            headers=auth_headers
-        )
+        # Read-only tests are independent, so by default they run concurrently
+        # (each with its own pool of `concurrent` workers) to measure the server
+        # under mixed load
+        if args.sequential:
+            for spec in READ_TESTS:
+                await tester.test_endpoint_performance(**spec)
+        else:
+            read_results = await asyncio.gather(
+                *(tester.test_endpoint_performance(**spec) for spec in READ_TESTS)
+            )
+            # Results were appended in completion order; keep the summary stable
+            tester.results[-len(read_results):] = read_results
         
-        # Test transfer creation (more intensive)
+        # Test transfer creation (more intensive); mutating, so always run on its own
         transfer_data = {
             "amount": 100.0,
             "currency": "USD",
@@ -262,7 +501,8 @@ async def main():
             endpoint="/api/v1/transfers",
             num_requests=30,  # Fewer requests since this creates data
             concurrent=5,
-            headers=auth_headers,
+            warmup=False,  # Warmup would move extra money out of the test account
+            open_loop=False,  # An open-loop run would send target_rps * duration transfers
             json=transfer_data
         )
         
@@ -271,9 +511,20 @@ async def main():
         print("Make sure the application is running and accessible.")
     
     finally:
+        await tester.close()
         # Print summary
         tester.print_summary()
 
 
+def install_event_loop():
+    """Use uvloop when available; it cuts per-callback overhead of the default loop."""
+    try:
+        import uvloop
+    except ImportError:
+        return
+    uvloop.install()
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    install_event_loop()
+    asyncio.run(main(parse_args()))
\ No newline at end of file